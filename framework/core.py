@@ -23,6 +23,7 @@
 # Piglit core
 
 import errno
+import io
 import os
 import platform
 import re
@@ -74,6 +75,11 @@ class JSONWriter:
 
     JSONWriter is threadsafe.
 
+    Every dict item is written on its own line, indented by INDENT spaces
+    per level. The values themselves are encoded with the given indent, by
+    default (indent=None) each one is written compactly on a single line,
+    which makes the results file much smaller.
+
     Example
     -------
 
@@ -90,7 +96,7 @@ class JSONWriter:
             indent=JSONWriter.INDENT)
 
     is equivalent to::
-        w = JSONWriter(file)
+        w = JSONWriter(file, indent=JSONWriter.INDENT)
         w.open_dict()
         w.write_dict_item('a', [1, 2, 3])
         w.write_dict_item('b', 4)
@@ -98,7 +104,7 @@ class JSONWriter:
         w.close_dict()
 
     which is also equivalent to::
-        w = JSONWriter(file)
+        w = JSONWriter(file, indent=JSONWriter.INDENT)
         w.open_dict()
         w.write_dict_item('a', [1, 2, 3])
         w.write_dict_item('b', 4)
@@ -112,12 +118,40 @@ class JSONWriter:
     '''
 
     INDENT = 4
+    BUFFER_SIZE = 65536
+
+    # The buffer is flushed after this many items at the latest, so that
+    # little is lost if piglit is interrupted or the machine hangs.
+    FLUSH_ITEMS = 50
 
-    def __init__(self, file):
-        self.file = file
-        self.__indent_level = 0
-        self.__inhibit_next_indent = False
-        self.__encoder = PiglitJSONEncoder(indent=self.INDENT)
+    def __init__(self, file, indent=None):
+        # Route the many small writes through a large buffer so that they
+        # reach the file system as a few big writes. Objects that are not
+        # backed by a file descriptor (StringIO and friends) are used as is.
+        #
+        # The buffer only borrows the file descriptor, so keep a reference
+        # to the file object: if it were garbage collected the descriptor
+        # would be closed under the buffer.
+        self.__file = file
+        try:
+            fd = file.fileno()
+        except (AttributeError, IOError):
+            self.file = file
+        else:
+            file.flush()
+            self.file = io.BufferedWriter(io.FileIO(fd, 'w', closefd=False),
+                                          self.BUFFER_SIZE)
+
+        # self.__indents
+        #
+        # A stack of indentation strings, one per open collection. The
+        # top of the stack is the indentation of the current level, so
+        # the strings are built once instead of on every write.
+        self.__indents = ['']
+        self.__unflushed_items = 0
+        self.__encoder = self.encoder(indent)
+        self.__compact = indent is None
+        self.__key_separator = ':' if self.__compact else ': '
 
         # self.__is_collection_empty
         #
@@ -134,63 +168,97 @@ class JSONWriter:
         #
         self.__is_collection_empty = []
 
-    @synchronized_self
-    def __write_indent(self):
-        if self.__inhibit_next_indent:
-            self.__inhibit_next_indent = False
+    @staticmethod
+    def encoder(indent=None):
+        """ Return a PiglitJSONEncoder suitable for write_raw_item
+
+        ``indent`` must be the same as the one the writer was created with.
+
+        """
+        if indent is None:
+            return PiglitJSONEncoder(separators=(',', ':'))
+        return PiglitJSONEncoder(indent=indent)
+
+    # The private helpers do not take the lock themselves, only the public
+    # methods do, so that each public call acquires it exactly once.
+    def __write(self, encoded):
+        if self.__compact:
+            self.file.write(encoded)
             return
-        else:
-            i = ' ' * self.__indent_level * self.INDENT
-            self.file.write(i)
 
-    @synchronized_self
-    def __write(self, obj):
-        lines = list(self.__encoder.encode(obj).split('\n'))
-        n = len(lines)
-        for i in range(n):
-            self.__write_indent()
-            self.file.write(lines[i])
-            if i != n - 1:
-                self.file.write('\n')
+        # Values always follow a key on the same line, so only the lines
+        # after the first need to be indented.
+        sep = '\n' + self.__indents[-1]
+        self.file.write(encoded.replace('\n', sep))
 
     @synchronized_self
     def open_dict(self):
-        self.__write_indent()
         self.file.write('{')
 
-        self.__indent_level += 1
+        self.__indents.append(self.__indents[-1] + ' ' * self.INDENT)
         self.__is_collection_empty.append(True)
 
     @synchronized_self
     def close_dict(self, comma=True):
-        self.__indent_level -= 1
+        self.__indents.pop()
         self.__is_collection_empty.pop()
 
-        self.file.write('\n')
-        self.__write_indent()
-        self.file.write('}')
+        self.file.write('\n' + self.__indents[-1] + '}')
 
-    @synchronized_self
     def write_dict_item(self, key, value):
+        # Encode the value before taking the lock, encoding is by far the
+        # most expensive part of writing an item and PiglitJSONEncoder
+        # keeps no state between calls.
+        self.write_raw_item(key, self.__encoder.encode(value))
+
+    @synchronized_self
+    def write_raw_item(self, key, encoded):
+        """ Write a dict item whose value is an already encoded JSON string
+
+        ``encoded`` must have been produced by an encoder returned by
+        JSONWriter.encoder() for the writer's indent, it is reindented to
+        the current level.
+
+        """
         # Write key.
-        self.write_dict_key(key)
+        self.__write_key(key)
 
         # Write value.
-        self.__write(value)
+        self.__write(encoded)
+
+        self.__unflushed_items += 1
+        if self.__unflushed_items >= self.FLUSH_ITEMS:
+            self.flush()
 
     @synchronized_self
     def write_dict_key(self, key):
+        self.__write_key(key)
+
+    def __write_key(self, key):
         # Write comma if this is not the initial item in the dict.
         if self.__is_collection_empty[-1]:
             self.__is_collection_empty[-1] = False
+            comma = ''
         else:
-            self.file.write(',')
+            comma = ','
 
-        self.file.write('\n')
-        self.__write(key)
-        self.file.write(': ')
+        # Keys are always strings, so there is no need to go through the
+        # full encoder for them.
+        self.file.write(''.join([comma, '\n', self.__indents[-1],
+                                 json.encoder.encode_basestring_ascii(key),
+                                 self.__key_separator]))
 
-        self.__inhibit_next_indent = True
+    @synchronized_self
+    def flush(self):
+        """ Flush any buffered output to the underlying file """
+        self.file.flush()
+        self.__unflushed_items = 0
+
+    @synchronized_self
+    def close(self):
+        """ Flush any buffered output and close the underlying file """
+        self.file.close()
+        self.__file.close()
 
 
 # Ensure the given directory exists
@@ -236,6 +304,10 @@ if 'MESA_DEBUG' not in os.environ:
 
 
 class TestResult(dict):
+    # No per-instance __dict__ or weakref slot, a results file can hold
+    # tens of thousands of these.
+    __slots__ = ()
+
     def __init__(self, *args):
         dict.__init__(self, *args)
 
@@ -279,8 +351,10 @@ class TestrunResult:
 
             self.__dict__.update(raw_dict)
 
-            # Replace each raw dict in self.tests with a TestResult.
-            for (path, result) in self.tests.items():
+            # Replace each raw dict in self.tests with a TestResult. This is
+            # done in place, one test at a time, so that each raw dict can be
+            # freed as soon as it has been replaced.
+            for path, result in self.tests.iteritems():
                 self.tests[path] = TestResult(result)
 
     def __repairFile(self, file):
@@ -301,55 +375,61 @@ class TestrunResult:
                 is returned.
         '''
 
-        file.seek(0)
-        lines = file.readlines()
-
         # JSON object was not closed properly.
         #
         # To repair the file, we execute these steps:
-        #   1. Find the closing brace of the last, properly written
-        #      test result.
-        #   2. Discard all subsequent lines.
-        #   3. Remove the trailing comma of that test result.
-        #   4. Append enough closing braces to close the json object.
-        #   5. Return a file object containing the repaired JSON.
-
-        # Each non-terminal test result ends with this line:
-        safe_line = 2 * JSONWriter.INDENT * ' ' + '},\n'
+        #   1. Find the end of the last, properly written test result,
+        #      reading the file backwards in chunks since it is always
+        #      close to the end.
+        #   2. Discard everything after it, including its trailing comma.
+        #   3. Append enough closing braces to close the json object.
+        #   4. Return a file object containing the repaired JSON.
+
+        # Each non-terminal test result is followed by this: its trailing
+        # comma and the start of the next test name, which is indented by
+        # exactly two levels. JSONWriter writes this the same way whether
+        # the values themselves are indented or not.
+        safe_line = ',\n' + 2 * JSONWriter.INDENT * ' ' + '"'
+        chunk_size = 65536
 
         # Search for the last occurence of safe_line.
-        safe_line_num = None
-        for i in range(-1, - len(lines), -1):
-            if lines[i] == safe_line:
-                safe_line_num = i
-                break
-
-        if safe_line_num is None:
+        file.seek(0, os.SEEK_END)
+        pos = file.tell()
+        overlap = ''
+        safe_pos = -1
+        while pos > 0 and safe_pos == -1:
+            size = min(chunk_size, pos)
+            pos -= size
+            file.seek(pos)
+            # Only search the new chunk, plus enough of the previous one to
+            # find a safe_line straddling the two.
+            chunk = file.read(size) + overlap
+            safe_pos = chunk.rfind(safe_line)
+            overlap = chunk[:len(safe_line) - 1]
+
+        # Keep everything up to the end of that test result, but not its
+        # trailing comma.
+        if safe_pos != -1:
+            file.seek(0)
+            head = file.read(pos + safe_pos)
+
+        # The items of the options dict are at the same level as the test
+        # results, make sure that what was found is in the tests dict.
+        if safe_pos == -1 or \
+           '\n' + JSONWriter.INDENT * ' ' + '"tests":' not in head:
             raise Exception('failed to repair corrupt result file: ' +
                             file.name)
 
-        # Remove corrupt lines.
-        lines = lines[0:(safe_line_num + 1)]
-
-        # Remove trailing comma.
-        lines[-1] = 2 * JSONWriter.INDENT * ' ' + '}\n'
-
-        # Close json object.
-        lines.append(JSONWriter.INDENT * ' ' + '}\n')
-        lines.append('}')
-
-        # Return new file object containing the repaired JSON.
-        new_file = StringIO()
-        new_file.writelines(lines)
-        new_file.flush()
-        new_file.seek(0)
-        return new_file
+        # Close json object and return new file object containing the
+        # repaired JSON.
+        return StringIO(head + '\n' + JSONWriter.INDENT * ' ' + '}\n}')
 
     def write(self, file):
         # Serialize only the keys in serialized_keys.
         keys = set(self.__dict__.keys()).intersection(self.serialized_keys)
         raw_dict = dict([(k, self.__dict__[k]) for k in keys])
-        json.dump(raw_dict, file, indent=JSONWriter.INDENT)
+        json.dump(raw_dict, file, cls=PiglitJSONEncoder,
+                  separators=(',', ':'))
 
 
 class Environment:
@@ -374,8 +454,43 @@ class Environment:
         for each in exclude_filter:
             self.exclude_filter.append(re.compile(each))
 
+        # Search functions for each filter list, None if the list is empty.
+        # When possible the list is compiled into a single alternation, so
+        # that matching a test name is one regex search instead of one per
+        # filter.
+        self.filter_search = self.__search_function(self.filter)
+        self.exclude_search = self.__search_function(self.exclude_filter)
+
+    # Joining patterns changes the meaning of numbered backreferences after
+    # the first pattern, and an inline flag such as (?i) would apply to all
+    # of them. Any (? construct other than a non-capturing group, and any
+    # backslash followed by a digit, keeps the patterns separate.
+    __unjoinable_re = re.compile(r'\(\?[^:]|\\[0-9]')
+
+    @classmethod
+    def __search_function(cls, regexps):
+        if not regexps:
+            return None
+        def search_each(path):
+            return any(r.search(path) for r in regexps)
+
+        patterns = [r.pattern for r in regexps]
+        if any(cls.__unjoinable_re.search(p) for p in patterns):
+            return search_each
+        # The joined regex can exceed limits the individual patterns don't,
+        # such as Python 2's maximum of 100 groups per regex.
+        try:
+            return re.compile('|'.join('(?:{0})'.format(p)
+                                       for p in patterns)).search
+        except (re.error, AssertionError, OverflowError):
+            return search_each
+
     def __iter__(self):
         for key, values in self.__dict__.iteritems():
+            # The search functions are derived from the filter lists and are
+            # not part of the environment.
+            if key in ['filter_search', 'exclude_search']:
+                continue
             # If the values are regex compiled then yield their pattern
             # attribute, which is the original plaintext they were compiled
             # from, otherwise yield them normally.
@@ -398,7 +513,7 @@ class Environment:
     def collectData(self):
         result = {}
         system = platform.system()
-        if (system == 'Windows' or system.find("CYGWIN_NT") == 0):
+        if (system == 'Windows' or system.startswith("CYGWIN_NT")):
             result['wglinfo'] = self.run('wglinfo')
         else:
             result['glxinfo'] = self.run('glxinfo')
@@ -468,7 +583,7 @@ class Test(object):
 
 
 class Group(dict):
-    pass
+    __slots__ = ()
 
 
 class TestProfile:
@@ -488,40 +603,49 @@ class TestProfile:
         test_list['spec/glsl-1.30/preprocessor/compiler/void.frag']
         '''
 
-        def f(prefix, group, test_dict):
-            for key in group:
-                fullkey = key if prefix == '' else os.path.join(prefix, key)
-                if isinstance(group[key], dict):
-                    f(fullkey, group[key], test_dict)
+        # Walk the tree with an explicit stack rather than recursion, and
+        # join names by hand since os.path.join is comparatively slow.
+        stack = [('', self.tests)]
+        while stack:
+            prefix, group = stack.pop()
+            for key, value in group.iteritems():
+                fullkey = key if prefix == '' else prefix + '/' + key
+                if isinstance(value, dict):
+                    stack.append((fullkey, value))
                 else:
-                    test_dict[fullkey] = group[key]
-        f('', self.tests, self.test_list)
+                    self.test_list[fullkey] = value
         # Clear out the old Group()
         self.tests = Group()
 
     def prepare_test_list(self, env):
         self.flatten_group_hierarchy()
 
-        def matches_any_regexp(x, re_list):
-            return True in map(lambda r: r.search(x) is not None, re_list)
+        # Look the filters up once rather than for every test
+        include = env.filter_search
+        exclude = env.exclude_search
+        exclude_tests = env.exclude_tests
+        filters = self.filters
 
-        def test_matches(path, test):
+        def test_matches(path):
             """Filter for user-specified restrictions"""
-            return ((not env.filter or matches_any_regexp(path, env.filter))
-                    and not path in env.exclude_tests and
-                    not matches_any_regexp(path, env.exclude_filter))
+            return ((include is None or include(path)) and
+                    path not in exclude_tests and
+                    (exclude is None or not exclude(path)))
 
-        filters = self.filters + [test_matches]
-        def check_all(item):
-            path, test = item
+        def check_all(path, test):
+            if not test_matches(path):
+                return False
             for f in filters:
                 if not f(path, test):
                     return False
             return True
 
-        # Filter out unwanted tests
-        self.test_list = dict(item for item in self.test_list.iteritems()
-                              if check_all(item))
+        # Filter out unwanted tests. They are deleted in place rather than
+        # building a second dictionary with the tests that are kept.
+        drop = [path for path, test in self.test_list.iteritems()
+                if not check_all(path, test)]
+        for path in drop:
+            del self.test_list[path]
 
     def run(self, env, json_writer):
         '''
@@ -544,22 +668,32 @@ class TestProfile:
         # Multiprocessing.dummy is a wrapper around Threading that provides a
         # multiprocessing compatible API
         #
+        # Threads rather than processes are used on purpose: almost all of
+        # the time of a test is spent waiting on the test executable, and
+        # the Test instances and the json_writer would otherwise have to be
+        # pickled and shared between processes. The return values are never
+        # looked at, so imap_unordered spares the pools from keeping them in
+        # order.
+        #
         # The default value of pool is the number of virtual processor cores
         single = multiprocessing.dummy.Pool(1)
         multi = multiprocessing.dummy.Pool()
         chunksize = 50
 
         if env.concurrent == "all":
-            multi.imap(test, self.test_list.iteritems(), chunksize)
+            multi.imap_unordered(test, self.test_list.iteritems(),
+                                 chunksize)
         elif env.concurrent == "none":
-            single.imap(test, self.test_list.iteritems(), chunksize)
+            single.imap_unordered(test, self.test_list.iteritems(),
+                                  chunksize)
         else:
             # Filter and return only thread safe tests to the threaded pool
-            multi.imap(test, (x for x in self.test_list.iteritems() if
-                              x[1].runConcurrent), chunksize)
+            multi.imap_unordered(test, (x for x in self.test_list.iteritems()
+                                        if x[1].runConcurrent), chunksize)
             # Filter and return the non thread safe tests to the single pool
-            single.imap(test, (x for x in self.test_list.iteritems() if not
-                               x[1].runConcurrent), chunksize)
+            single.imap_unordered(test, (x for x in self.test_list.iteritems()
+                                         if not x[1].runConcurrent),
+                                  chunksize)
 
         # Close and join the pools
         # If we don't close and the join the pools the script will exit before
@@ -569,6 +703,8 @@ class TestProfile:
         multi.join()
         single.join()
 
+        json_writer.flush()
+
     def filter_tests(self, function):
         """Filter out tests that return false from the supplied function
 
@@ -0,0 +1,242 @@
+# Copyright (c) 2014 Intel Corporation
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Module providing tests for the core module """
+
+
+import tempfile
+import json
+from cStringIO import StringIO
+import framework.core as core
+
+
+DATA = {
+    'options': {
+        'profile': 'tests/quick.py',
+        'filter': [],
+    },
+    'name': 'test-run',
+    'tests': {
+        'spec/a/b': {'result': 'pass', 'time': 1.5},
+        'spec/a/c': {'result': 'fail', 'info': 'line 1\nline 2'},
+    },
+}
+
+# JSONWriter writes compact values by default, and indented ones on request
+INDENTS = [None, core.JSONWriter.INDENT]
+
+
+def write_with_json_writer(data, file, indent=None):
+    """ Write data with a JSONWriter the way piglit-run does """
+    writer = core.JSONWriter(file, indent=indent)
+    writer.open_dict()
+    for key in ['options', 'name', 'tests']:
+        if isinstance(data[key], dict):
+            writer.write_dict_key(key)
+            writer.open_dict()
+            for k, v in sorted(data[key].iteritems()):
+                writer.write_dict_item(k, v)
+            writer.close_dict()
+        else:
+            writer.write_dict_item(key, data[key])
+    writer.close_dict()
+    writer.flush()
+
+
+def check_json_writer_roundtrip(indent):
+    with tempfile.TemporaryFile() as f:
+        write_with_json_writer(DATA, f, indent)
+        f.seek(0)
+        assert json.load(f) == DATA
+
+
+def test_json_writer_roundtrip():
+    """ Output of JSONWriter can be read back by the json module """
+    for indent in INDENTS:
+        yield check_json_writer_roundtrip, indent
+
+
+def test_json_writer_compact():
+    """ JSONWriter writes each value on a single line by default """
+    f = StringIO()
+    write_with_json_writer(DATA, f)
+    lines = f.getvalue().split('\n')
+    line = [l for l in lines if l.startswith('        "spec/a/b":')][0]
+
+    assert line.endswith(',')
+    assert json.loads(line.split(':', 1)[1][:-1]) == DATA['tests']['spec/a/b']
+
+
+def check_json_writer_raw_item(indent):
+    value = DATA['tests']['spec/a/b']
+    encoded = core.JSONWriter.encoder(indent).encode(value)
+
+    output = []
+    for write in ['write_dict_item', 'write_raw_item']:
+        f = StringIO()
+        writer = core.JSONWriter(f, indent=indent)
+        writer.open_dict()
+        writer.write_dict_key('tests')
+        writer.open_dict()
+        if write == 'write_dict_item':
+            writer.write_dict_item('spec/a/b', value)
+        else:
+            writer.write_raw_item('spec/a/b', encoded)
+        writer.close_dict()
+        writer.close_dict()
+        output.append(f.getvalue())
+
+    assert output[0] == output[1]
+
+
+def test_json_writer_raw_item():
+    """ write_raw_item produces the same output as write_dict_item """
+    for indent in INDENTS:
+        yield check_json_writer_raw_item, indent
+
+
+def check_repair_truncated_results(indent):
+    with tempfile.NamedTemporaryFile() as f:
+        write_with_json_writer(DATA, f, indent)
+        f.seek(0)
+        content = f.read()
+
+        # Cut the file in the middle of the last test result
+        f.seek(0)
+        f.truncate()
+        f.write(content[:content.index('"spec/a/c"') + 20])
+        f.flush()
+        f.seek(0)
+
+        result = core.TestrunResult(f)
+        assert result.tests.keys() == ['spec/a/b']
+
+
+def test_repair_truncated_results():
+    """ TestrunResult drops the incomplete trailing test of a truncated file
+    """
+    for indent in INDENTS:
+        yield check_repair_truncated_results, indent
+
+
+def test_flatten_group_hierarchy():
+    """ TestProfile.flatten_group_hierarchy produces fully qualified names """
+    profile = core.TestProfile()
+    profile.tests['spec'] = core.Group()
+    profile.tests['spec']['glsl-1.30'] = core.Group()
+    profile.tests['spec']['glsl-1.30']['void.frag'] = 'a'
+    profile.tests['spec']['other'] = 'b'
+    profile.tests['top'] = 'c'
+    profile.flatten_group_hierarchy()
+
+    assert profile.test_list == {'spec/glsl-1.30/void.frag': 'a',
+                                 'spec/other': 'b',
+                                 'top': 'c'}
+    assert profile.tests == {}
+
+
+def test_prepare_test_list_filters():
+    """ TestProfile.prepare_test_list applies include and exclude filters """
+    env = core.Environment(include_filter=['spec', 'glean/a'],
+                           exclude_filter=['vs$', 'b/c'])
+    profile = core.TestProfile()
+    for name in ['spec/a/fs', 'spec/a/vs', 'spec/b/c', 'glean/a', 'glean/b',
+                 'shaders/fs']:
+        profile.test_list[name] = None
+    profile.prepare_test_list(env)
+
+    assert sorted(profile.test_list) == ['glean/a', 'spec/a/fs']
+
+
+def test_environment_iter():
+    """ Iterating over an Environment yields the filters as plain patterns
+    """
+    env = core.Environment(include_filter=['spec'], exclude_filter=['vs$'])
+    options = dict(env)
+
+    assert options['filter'] == ['spec']
+    assert options['exclude_filter'] == ['vs$']
+    assert 'filter_search' not in options
+    assert 'exclude_search' not in options
+
+
+def test_load_results_test_result():
+    """ TestrunResult loads each test as a TestResult with a status """
+    with tempfile.TemporaryFile() as f:
+        write_with_json_writer(DATA, f)
+        f.seek(0)
+        result = core.TestrunResult(f)
+
+    for test in result.tests.itervalues():
+        assert isinstance(test, core.TestResult)
+    assert result.tests['spec/a/b']['result'] == core.status.Pass()
+    assert not isinstance(result.options, core.TestResult)
+
+
+def test_json_writer_owns_file():
+    """ JSONWriter keeps working when it holds the only file reference """
+    with tempfile.NamedTemporaryFile() as f:
+        writer = core.JSONWriter(open(f.name, 'w+'))
+        writer.open_dict()
+        writer.write_dict_item('name', 'test-run')
+        writer.close_dict()
+        writer.close()
+
+        assert json.load(f) == {'name': 'test-run'}
+
+
+def test_prepare_test_list_unjoinable_filters():
+    """ Filters using inline flags or backreferences keep their own meaning
+    """
+    env = core.Environment(include_filter=['(?i)SPEC', r'(a)/\1'],
+                           exclude_filter=['b$'])
+    profile = core.TestProfile()
+    for name in ['spec/a/fs', 'glean/a/a', 'glean/A/a', 'Spec/b']:
+        profile.test_list[name] = None
+    profile.prepare_test_list(env)
+
+    assert sorted(profile.test_list) == ['glean/a/a', 'spec/a/fs']
+
+
+def test_prepare_test_list_many_groups():
+    """ Filters with more groups in total than one regex allows still work
+    """
+    env = core.Environment(
+        exclude_filter=['spec/(a|b){0}$'.format(i) for i in range(101)])
+    profile = core.TestProfile()
+    for name in ['spec/a1', 'spec/b100', 'spec/c1', 'spec/a101']:
+        profile.test_list[name] = None
+    profile.prepare_test_list(env)
+
+    assert sorted(profile.test_list) == ['spec/a101', 'spec/c1']
+
+
+def test_load_results_nested_result():
+    """ Only the direct values of 'tests' are loaded as TestResults """
+    f = StringIO(json.dumps({
+        'name': 'test-run',
+        'tests': {'a': {'result': 'pass', 'info': {'result': 3}},
+                  'b': {'info': 'no result'}}}))
+    result = core.TestrunResult(f)
+
+    assert isinstance(result.tests['a'], core.TestResult)
+    assert isinstance(result.tests['b'], core.TestResult)
+    assert result.tests['a']['info'] == {'result': 3}
+    assert not isinstance(result.tests['a']['info'], core.TestResult)
@@ -57,30 +57,35 @@ def main():
 
     results_path = path.join(args.results_path, "main")
     json_writer = core.JSONWriter(open(results_path, 'w+'))
-    json_writer.open_dict()
-    json_writer.write_dict_key("options")
-    json_writer.open_dict()
-    for key, value in results.options.iteritems():
-        json_writer.write_dict_item(key, value)
-    json_writer.close_dict()
+    # Whatever happens, make sure the results written so far reach the
+    # disk so that the run can be resumed.
+    try:
+        json_writer.open_dict()
+        json_writer.write_dict_key("options")
+        json_writer.open_dict()
+        for key, value in results.options.iteritems():
+            json_writer.write_dict_item(key, value)
+        json_writer.close_dict()
+
+        json_writer.write_dict_item('name', results.name)
+        for (key, value) in env.collectData().items():
+            json_writer.write_dict_item(key, value)
 
-    json_writer.write_dict_item('name', results.name)
-    for (key, value) in env.collectData().items():
-        json_writer.write_dict_item(key, value)
+        json_writer.write_dict_key('tests')
+        json_writer.open_dict()
+        for key, value in results.tests.iteritems():
+            json_writer.write_dict_item(key, value)
+            env.exclude_tests.add(key)
 
-    json_writer.write_dict_key('tests')
-    json_writer.open_dict()
-    for key, value in results.tests.iteritems():
-        json_writer.write_dict_item(key, value)
-        env.exclude_tests.add(key)
-    
-    profile = core.merge_test_profiles(results.options['profile'])
-    # This is resumed, don't bother with time since it wont be accurate anyway
-    profile.run(env, json_writer)
+        profile = core.merge_test_profiles(results.options['profile'])
+        # This is resumed, don't bother with time since it wont be accurate
+        # anyway
+        profile.run(env, json_writer)
 
-    json_writer.close_dict()
-    json_writer.close_dict()
-    json_writer.file.close()
+        json_writer.close_dict()
+        json_writer.close_dict()
+    finally:
+        json_writer.close()
 
     print("\n"
           "Thank you for running Piglit!\n"
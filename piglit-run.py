@@ -129,39 +129,43 @@ def main():
     result_filepath = path.join(args.results_path, 'main')
     result_file = open(result_filepath, 'w')
     json_writer = core.JSONWriter(result_file)
-    json_writer.open_dict()
-
-    # Write out command line options for use in resuming.
-    json_writer.write_dict_key('options')
-    json_writer.open_dict()
-    json_writer.write_dict_item('profile', args.test_profile)
-    for key, value in env:
-        json_writer.write_dict_item(key, value)
-    if args.platform:
-        json_writer.write_dict_item('platform', args.platform)
-    json_writer.close_dict()
-
-    json_writer.write_dict_item('name', results.name)
-
-    for (key, value) in env.collectData().items():
-        json_writer.write_dict_item(key, value)
-
-    profile = core.merge_test_profiles(args.test_profile)
-
-    json_writer.write_dict_key('tests')
-    json_writer.open_dict()
-    time_start = time.time()
-    profile.run(env, json_writer)
-    time_end = time.time()
-
-    json_writer.close_dict()
-
-    results.time_elapsed = time_end - time_start
-    json_writer.write_dict_item('time_elapsed', results.time_elapsed)
-
-    # End json.
-    json_writer.close_dict()
-    json_writer.file.close()
+    # Whatever happens, make sure the results written so far reach the
+    # disk so that the run can be resumed.
+    try:
+        json_writer.open_dict()
+
+        # Write out command line options for use in resuming.
+        json_writer.write_dict_key('options')
+        json_writer.open_dict()
+        json_writer.write_dict_item('profile', args.test_profile)
+        for key, value in env:
+            json_writer.write_dict_item(key, value)
+        if args.platform:
+            json_writer.write_dict_item('platform', args.platform)
+        json_writer.close_dict()
+
+        json_writer.write_dict_item('name', results.name)
+
+        for (key, value) in env.collectData().items():
+            json_writer.write_dict_item(key, value)
+
+        profile = core.merge_test_profiles(args.test_profile)
+
+        json_writer.write_dict_key('tests')
+        json_writer.open_dict()
+        time_start = time.time()
+        profile.run(env, json_writer)
+        time_end = time.time()
+
+        json_writer.close_dict()
+
+        results.time_elapsed = time_end - time_start
+        json_writer.write_dict_item('time_elapsed', results.time_elapsed)
+
+        # End json.
+        json_writer.close_dict()
+    finally:
+        json_writer.close()
 
     print
     print 'Thank you for running Piglit!'
@@ -22,10 +22,14 @@
 # OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import errno
+import json
 import os
 import re
 import sys
 import subprocess
+import multiprocessing
+import tempfile
 
 from os import path
 from framework.core import testBinDir, TestProfile, TestResult
@@ -50,9 +54,14 @@ def checkEnvironment():
         print "Test Environment check: debugfs not mounted properly!"
         return False
     for subdir in os.listdir(debugfs_path):
-        clients = open(os.path.join(debugfs_path, subdir, "clients"), 'r')
-        lines = clients.readlines()
-        if len(lines) > 2:
+        # Only the number of lines matters, so stop counting at 3
+        with open(os.path.join(debugfs_path, subdir, "clients"), 'r') as clients:
+            lines = 0
+            for line in clients:
+                lines += 1
+                if lines > 2:
+                    break
+        if lines > 2:
             print "Test Environment check: other drm clients running!"
             return False
 
@@ -100,21 +109,22 @@ def listTests(listname):
     oldDir = os.getcwd()
     try:
         os.chdir(igtTestRoot)
-        proc = subprocess.Popen(
-                ['make', listname ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env=os.environ.copy(),
-                universal_newlines=True
-                )
-        out, err = proc.communicate()
+        with open(os.devnull, 'r') as devnull:
+            proc = subprocess.Popen(
+                    ['make', listname ],
+                    stdin=devnull,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True
+                    )
+            out, err = proc.communicate()
         returncode = proc.returncode
     finally:
         os.chdir(oldDir)
 
     lines = out.split('\n')
     found_header = False
-    progs = ""
+    progs = []
 
     for line in lines:
         if found_header:
@@ -126,31 +136,96 @@ def listTests(listname):
 
     return progs
 
-singleTests = listTests("list-single-tests")
+def listSubTests(tests):
+    # The binaries are started in batches of one per CPU, and the output of
+    # a batch is read only once all of it is running, so that they run in
+    # parallel. Threads can't be used for this: the profile is built while
+    # this module is imported, and in Python 2 any import done from another
+    # thread at that point deadlocks on the import lock.
+    batch_size = multiprocessing.cpu_count()
+    subtests = {}
+    with open(os.devnull, 'r') as devnull:
+        for i in range(0, len(tests), batch_size):
+            batch = tests[i:i + batch_size]
+            procs = []
+            for test in batch:
+                procs.append(subprocess.Popen(
+                        [path.join(igtTestRoot, test), '--list-subtests' ],
+                        stdin=devnull,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        universal_newlines=True
+                        ))
+
+            for test, proc in zip(batch, procs):
+                out, err = proc.communicate()
+                subtests[test] = [subtest for subtest in out.split("\n")
+                                  if subtest != ""]
+
+    return subtests
+
+# Listing the tests means running make and every multi-test binary, which
+# is slow, so the lists are cached between runs.
+igtCacheFile = path.join(os.environ.get('XDG_CACHE_HOME',
+                                        path.expanduser('~/.cache')),
+                         'piglit', 'igt-tests.json')
+
+def cacheKey(tests):
+    # The cache is valid as long as no test binary has been added, removed
+    # or rebuilt, and the makefiles producing the lists are unchanged.
+    key = [os.stat(igtTestRoot).st_mtime]
+    for f in ['Makefile', 'Makefile.sources'] + tests:
+        try:
+            key.append(os.stat(path.join(igtTestRoot, f)).st_mtime)
+        except OSError:
+            key.append(None)
+    return key
+
+def loadTestLists():
+    try:
+        with open(igtCacheFile, 'r') as f:
+            cache = json.load(f)
+        if cache['root'] == igtTestRoot and \
+           cache['key'] == cacheKey(cache['single'] + sorted(cache['multi'])):
+            return cache['single'], cache['multi']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+
+    singleTests = listTests("list-single-tests")
+    multiTests = listSubTests(listTests("list-multi-tests"))
+
+    cache = {'root': igtTestRoot,
+             'key': cacheKey(list(singleTests) + sorted(multiTests)),
+             'single': singleTests,
+             'multi': multiTests}
+    try:
+        try:
+            os.makedirs(path.dirname(igtCacheFile))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first and rename it into place, so that
+        # another piglit instance never reads a partially written cache.
+        with tempfile.NamedTemporaryFile('w', dir=path.dirname(igtCacheFile),
+                                         delete=False) as f:
+            try:
+                json.dump(cache, f)
+            except:
+                os.unlink(f.name)
+                raise
+        os.rename(f.name, igtCacheFile)
+    except (IOError, OSError):
+        # Not being able to cache the lists is not an error
+        pass
+
+    return singleTests, multiTests
+
+singleTests, multiTests = loadTestLists()
 
 for test in singleTests:
     profile.test_list[path.join('igt', test)] = IGTTest(test)
 
-def addSubTestCases(test):
-    proc = subprocess.Popen(
-            [path.join(igtTestRoot, test), '--list-subtests' ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=os.environ.copy(),
-            universal_newlines=True
-            )
-    out, err = proc.communicate()
-    returncode = proc.returncode
-
-    subtests = out.split("\n")
-
+for test, subtests in multiTests.iteritems():
     for subtest in subtests:
-        if subtest == "":
-            continue
         profile.test_list[path.join('igt', test, subtest)] = \
             IGTTest(test, ['--run-subtest', subtest])
-
-multiTests = listTests("list-multi-tests")
-
-for test in multiTests:
-    addSubTestCases(test)